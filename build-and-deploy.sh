@@ -7,6 +7,7 @@
 #
 # Features:
 # - Cleans previous builds
+# - Compiles the directory walker with mypyc when available
 # - Creates PyInstaller executable
 # - Attempts static binary creation with staticx
 # - Uploads binary to remote server via SFTP
@@ -20,7 +21,7 @@ echo "Working directory: $(pwd)"
 echo "========================================================="
 
 echo "Cleaning previous builds..."
-rm -rf build/ dist/ *.spec chksync-static
+rm -rf build/ dist/ *.spec chksync-static chksync_walk.*.so
 
 echo "Building chksync application..."
 if ! command -v pyinstaller &> /dev/null; then
@@ -29,6 +30,18 @@ if ! command -v pyinstaller &> /dev/null; then
     exit 1
 fi
 
+echo "Compiling directory walker..."
+if command -v mypyc &> /dev/null; then
+    if mypyc chksync_walk.py; then
+        echo "Compiled chksync_walk with mypyc"
+    else
+        echo "mypyc failed, using the pure Python walker..."
+        rm -f chksync_walk.*.so
+    fi
+else
+    echo "mypyc not found, using the pure Python walker..."
+fi
+
 pyinstaller --onefile chksync.py
 if [ $? -ne 0 ]; then
     echo "Error: PyInstaller build failed"
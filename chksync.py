@@ -2,211 +2,535 @@
 """A tool to compare two folders and show differences in size and file count."""
 
 import argparse
+import ctypes
+import ctypes.util
+import errno
+import hashlib
+import logging
 import os
+import platform
+import re
+import stat
 import sys
 import csv
 import io
-import pandas as pd
-from rich.console import Console
-from rich.markdown import Markdown
-from rich.table import Table
-from tabulate import tabulate
+import threading
+import time
+from array import array
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import partial
+import numpy as np
+from chksync_walk import SCANDIR_DIR_FD, walk_size_count
+try:
+    import resource
+except ImportError:
+    resource = None
+try:
+    import scandir_rs
+except ImportError:
+    scandir_rs = None
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+log = logging.getLogger('chksync')
+
+# Whether stdout is a terminal, checked once at startup.
+_STDOUT_IS_TTY = sys.stdout is not None and sys.stdout.isatty()
+
+
+# statx(2) constants; the syscall number differs per architecture.
+_STATX_SYSCALL_NUMBERS = {'x86_64': 332, 'aarch64': 291, 'riscv64': 291}
+_AT_FDCWD = -100
+_AT_SYMLINK_NOFOLLOW = 0x100
+_AT_NO_AUTOMOUNT = 0x800
+_AT_STATX_DONT_SYNC = 0x4000
+_STATX_SIZE = 0x200
+
+
+class _StatxTimestamp(ctypes.Structure):
+    _fields_ = [
+        ('tv_sec', ctypes.c_int64), ('tv_nsec', ctypes.c_uint32), ('_reserved', ctypes.c_int32),
+    ]
+
+
+class _Statx(ctypes.Structure):
+    _fields_ = [
+        ('stx_mask', ctypes.c_uint32), ('stx_blksize', ctypes.c_uint32),
+        ('stx_attributes', ctypes.c_uint64),
+        ('stx_nlink', ctypes.c_uint32), ('stx_uid', ctypes.c_uint32),
+        ('stx_gid', ctypes.c_uint32), ('stx_mode', ctypes.c_uint16),
+        ('_spare0', ctypes.c_uint16),
+        ('stx_ino', ctypes.c_uint64), ('stx_size', ctypes.c_uint64),
+        ('stx_blocks', ctypes.c_uint64), ('stx_attributes_mask', ctypes.c_uint64),
+        ('stx_atime', _StatxTimestamp), ('stx_btime', _StatxTimestamp),
+        ('stx_ctime', _StatxTimestamp), ('stx_mtime', _StatxTimestamp),
+        ('stx_rdev_major', ctypes.c_uint32), ('stx_rdev_minor', ctypes.c_uint32),
+        ('stx_dev_major', ctypes.c_uint32), ('stx_dev_minor', ctypes.c_uint32),
+        ('_spare2', ctypes.c_uint64 * 14),
+    ]
+
+
+class StatxSizer:
+    """Look up file sizes with Linux statx(2), asking the kernel for STATX_SIZE only.
+
+    AT_STATX_DONT_SYNC lets network filesystems answer from their attribute
+    cache instead of revalidating with the server on every call.
+    """
+
+    def __init__(self):
+        self.available = False
+        self._local = threading.local()
+
+        syscall_nr = _STATX_SYSCALL_NUMBERS.get(platform.machine())
+        if not sys.platform.startswith('linux') or syscall_nr is None:
+            return
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        except OSError:
+            return
+
+        self._syscall = libc.syscall
+        self._syscall.restype = ctypes.c_long
+        self._syscall_nr = ctypes.c_long(syscall_nr)
+        self._flags = ctypes.c_long(_AT_STATX_DONT_SYNC | _AT_SYMLINK_NOFOLLOW | _AT_NO_AUTOMOUNT)
+        self._mask = ctypes.c_long(_STATX_SIZE)
+        self._at_fdcwd = ctypes.c_long(_AT_FDCWD)
+        self.available = True
+
+    def size(self, path, dir_fd=None):
+        """Return the size of path without following symlinks.
+
+        A relative path is resolved against dir_fd when given, otherwise
+        against the current directory.
+        """
+        buf = getattr(self._local, 'buf', None)
+        if buf is None:
+            buf = self._local.buf = _Statx()
+
+        ret = self._syscall(
+            self._syscall_nr, self._at_fdcwd if dir_fd is None else ctypes.c_long(dir_fd),
+            os.fsencode(path), self._flags, self._mask, ctypes.byref(buf)
+        )
+        if ret == 0:
+            return buf.stx_size
 
+        err = ctypes.get_errno()
+        if err in (errno.ENOSYS, errno.EPERM):
+            # Old kernel or a seccomp filter that blocks statx: stop trying.
+            self.available = False
+            return os.stat(path, dir_fd=dir_fd, follow_symlinks=False).st_size
+        raise OSError(err, os.strerror(err), path)
 
-class DebugUtils:
-    """Utility class for debug printing."""
-    
-    @staticmethod
-    def debug_print(message, vars_to_show=None):
-        """Print debug messages with function name, line number, and optional caller variables."""
-        frame = sys._getframe(2)
-        line_num = frame.f_lineno
-        func_name = frame.f_code.co_name
-
-        var_info = ""
-        if vars_to_show:
-            caller_locals = frame.f_locals
-            var_values = []
-            for var_name in vars_to_show:
-                if var_name in caller_locals:
-                    var_values.append(f"{var_name}={caller_locals[var_name]}")
-                else:
-                    var_values.append(f"{var_name}=<not found>")
-            var_info = f" [{', '.join(var_values)}]"
 
-        print(f"({func_name:<25}:{line_num:>3}){var_info} {message}")
+_STATX = StatxSizer()
 
-    @staticmethod
-    def debug_with_counters(message):
-        """Debug print that automatically shows common counter variables."""
-        frame = sys._getframe(2)
-        caller_locals = frame.f_locals
-
-        counters = [
-            'folder', 'entry', 'fp', 'processed_parent_items', 'num_sized_files_total',
-            'num_sized_files_this_folder', 'counted_files_total', 'counted_files_this_folder',
-            'processed_files', 'total_file_size_so_far', 'filecount_this_item',
-            'size_this_item', 'size_this_file', 'total_size_this_folder'
-        ]
-        found_counters = []
-        for var in counters:
-            if var in caller_locals:
-                found_counters.append(f"{var.upper():<27} == {caller_locals[var]}")
-        
-        sep = "\n" + " " * 33 + "- "
-        counter_info = f"{sep}{sep.join(found_counters)}" if found_counters else ""
+COLUMNS = ['Name', 'Size1', 'Size2', 'SD', 'Filecount1', 'Filecount2', 'CD', 'DIFF']
+
+# One row of the comparison table; a tuple per row is far smaller than a dict.
+ComparisonRow = namedtuple('ComparisonRow', COLUMNS)
+# First level entries of a scanned folder: names with parallel int64
+# arrays of sizes and file counts, plus uint64 content digests with --hash
+# (None otherwise).
+ScanResult = namedtuple('ScanResult', ['names', 'sizes', 'counts', 'digests'])
+
+# Minimum number of seconds between progress line redraws.
+PROGRESS_INTERVAL = 0.25
+
+# Directories a single scanner task reads before handing the rest of its
+# stack back to be shared out between workers.
+WALK_BATCH_DIRS = 64
+
+# Above this many rows auto-detection picks plain output even on a terminal;
+# rich resolves styles per cell, which gets slow on large comparisons.
+RICH_AUTO_MAX_ROWS = 1000
 
-        line_num = frame.f_lineno
-        func_name = frame.f_code.co_name
-        print(f"({func_name:<25}:{line_num:>3}) {message}{counter_info}")
+# Bytes read per call when hashing file contents for --hash.
+HASH_CHUNK_SIZE = 1 << 20
+
+# Linux's table of the mounts visible to this process, used by --fast-mounts.
+MOUNTINFO_PATH = '/proc/self/mountinfo'
+
+
+def _noop(*args):
+    """Stand-in for debug helpers when debug output is disabled."""
+
+
+def _filesystem_roots():
+    """Return the mount points at which a filesystem is mounted from its root.
+
+    Read from MOUNTINFO_PATH. Bind mounts of a subdirectory and btrfs
+    subvolume mounts have a root other than '/' and are left out. Returns an
+    empty set where the table can't be read (e.g. outside Linux).
+    """
+    mounts = {}
+    try:
+        with open(MOUNTINFO_PATH, encoding='utf-8', errors='surrogateescape') as f:
+            for line in f:
+                fields = line.split()
+                # Later lines mount over earlier ones at the same point.
+                mounts[_unescape_mount_path(fields[4])] = fields[3]
+    except (OSError, IndexError) as e:
+        log.debug("Cannot read %s: %s", MOUNTINFO_PATH, e)
+        return set()
+    return {mount_point for mount_point, root in mounts.items() if root == '/'}
+
+
+def _unescape_mount_path(path):
+    """Undo the octal escapes (e.g. \\040 for a space) used in mountinfo paths."""
+    if '\\' not in path:
+        return path
+    return re.sub(r'\\([0-7]{3})', lambda m: chr(int(m.group(1), 8)), path)
+
+
+def _new_hash():
+    """Return a 64-bit content hasher: xxh3 if xxhash is installed, else BLAKE2b."""
+    if xxhash is not None:
+        return xxhash.xxh3_64()
+    return hashlib.blake2b(digest_size=8)
 
 
 class FolderScanner:
     """Handles scanning folders and collecting file/size information."""
     
-    def __init__(self, verbose_level=0):
+    def __init__(self, verbose_level=0, max_workers=None, hash_contents=False,
+                 fast_mounts=False, dedupe_hardlinks=False):
         self.verbose_level = verbose_level
+        self.hash_contents = hash_contents
+        self.fast_mounts = fast_mounts
+        self._filesystem_roots = _filesystem_roots() if fast_mounts else set()
+        self.dedupe_hardlinks = dedupe_hardlinks
+        self.max_workers = max_workers or self.default_workers()
+        self._print_lock = threading.Lock()
+        # Shared by both folders' concurrent scans, so together they redraw
+        # the progress line at most once per PROGRESS_INTERVAL.
+        self._last_progress = 0.0
+        # Debug output is bound once: below -vv every call site is a no-op
+        # and its arguments are never formatted.
+        self._dbg = log.debug if verbose_level >= 2 else _noop
+        # (st_dev, st_ino) of walked subdirectories -> (size, count), so a
+        # subtree reachable from both folders is only walked once.
+        self._subtree_cache = {}
     
+    @staticmethod
+    def default_workers():
+        """Return the default number of scanner threads for this platform."""
+        # APFS serialises directory reads on a per-volume lock, so extra
+        # threads on macOS only add contention.
+        if sys.platform == 'darwin':
+            return 4
+        return min(32, (os.cpu_count() or 1) * 4)
+
     def scan_folder(self, folder):
-        """Get first level entries from a folder with size and file count."""
-        if self.verbose_level >= 2:
-            DebugUtils.debug_with_counters("START: scanning a parent level item")
+        """Get first level entries from a folder with size and file count.
+
+        Returns a ScanResult of entry names and their sizes and file counts.
+        """
+        # Resolve the progress check once instead of per entry.
+        progress = self.verbose_level >= 1
+        # The folder part of the progress line is fixed for the whole scan.
+        progress_prefix = f"\rProcessing {folder:<30}, "
+        self._dbg("START: scanning %s", folder)
         
-        entries = {}
-        processed_parent_items = 0
-        num_sized_files_total = 0
-        counted_files_total = 0
-        total_file_size_so_far = 0
+        # Parallel arrays rather than a name -> (size, count) dict: two
+        # int64 slots per entry instead of a tuple object each.
+        names = []
+        sizes = array('q')
+        counts = array('q')
+        subdirs = []
+        total_files = 0
+        total_size = 0
+        folder_dev = os.stat(folder).st_dev if self.fast_mounts else None
+        # With --dedupe-hardlinks, files with more than one link are set
+        # aside in links and each inode is credited once, after the walks,
+        # to the first-level entry that sorts first. Crediting whichever
+        # walk reached it first would depend on thread timing and readdir
+        # order, so identical trees could show per-row differences.
+        links = {} if self.dedupe_hardlinks else None
+        note_link = self._hardlink_recorder(links) if links is not None else None
+        file_rows = {}
+        # Deduped subtree totals depend on the rest of this folder, so they
+        # aren't shared through the cache.
+        subtree_cache = self._subtree_cache if links is None else {}
 
         with os.scandir(folder) as dir_entries:
             for entry in dir_entries:
-                processed_parent_items += 1
-
                 try:
-                    if entry.is_file(follow_symlinks=False):
-                        num_sized_files_total += 1
-                        size_this_item = entry.stat().st_size
-                        filecount_this_item = 1
-                        counted_files_total += 1
-                        if self.verbose_level >= 2:
-                            DebugUtils.debug_with_counters("(Found file, skip scans) Scanning")
-                    elif entry.is_dir(follow_symlinks=False):
-                        path = entry.path
-                        size_this_item, num_sized_files_total = self._get_dir_size(
-                            path, parent_folder=folder, 
-                            num_sized_files_total=num_sized_files_total
-                        )
-
-                        filecount_this_item, counted_files_total = self._get_file_count(
-                            path, parent_folder=folder, 
-                            counted_files_total=counted_files_total
-                        )
-                        if self.verbose_level >= 2:
-                            DebugUtils.debug_with_counters("(Found directory, run scans) Scanning")
-                    else:
-                        continue
-
-                    entries[entry.name] = (size_this_item, filecount_this_item)
-                    total_file_size_so_far = (
-                        total_file_size_so_far + size_this_item 
-                        if size_this_item else total_file_size_so_far
-                    )
-
-                except (OSError, PermissionError) as e:
-                    if self.verbose_level >= 2:
-                        DebugUtils.debug_with_counters(f"Warning: Cannot access ENTRY=={entry.name}: {e}")
-                    continue
-
-                if self.verbose_level >= 1 and (
-                    counted_files_total % 100 == 0 
-                    or counted_files_total == filecount_this_item 
-                    or filecount_this_item > 100
-                ):
-                    if self.verbose_level >= 2:
-                        DebugUtils.debug_with_counters("processed 100 entries")
-                    print(
-                        f"\rProcessing {folder:<30}, "
-                        f"Total items: {counted_files_total:>10,} "
-                        f"Total size: {total_file_size_so_far:>10,}", 
-                        end="", flush=True
-                    )
-
-        if self.verbose_level >= 2:
-            DebugUtils.debug_with_counters("FINISH: scanning a parent level item")
+                    # Both branches need the stat anyway, so take the type
+                    # from it rather than from d_type, which some network
+                    # filesystems leave unset (making is_file/is_dir stat).
+                    st = entry.stat(follow_symlinks=False)
+                    if stat.S_ISREG(st.st_mode):
+                        if note_link is not None and not st.st_ino:
+                            # Windows leaves st_ino, st_dev and st_nlink of
+                            # DirEntry.stat() at 0; os.stat fills them in.
+                            st = os.stat(entry.path, follow_symlinks=False)
+                        if note_link is not None and st.st_nlink > 1 and st.st_ino:
+                            # Counted once the owner of the inode is known.
+                            note_link(entry.name, st.st_dev, st.st_ino, st.st_size)
+                            file_rows[entry.name] = len(names)
+                            size_this_item, filecount_this_item = 0, 0
+                        else:
+                            size_this_item, filecount_this_item = st.st_size, 1
+                        names.append(entry.name)
+                        sizes.append(size_this_item)
+                        counts.append(filecount_this_item)
+                        total_files += filecount_this_item
+                        total_size += size_this_item
+                        self._dbg("Found file %s: %d bytes", entry.name, size_this_item)
+                    elif stat.S_ISDIR(st.st_mode):
+                        if not st.st_ino:
+                            # Windows leaves st_ino and st_dev of
+                            # DirEntry.stat() at 0; os.stat fills them in.
+                            st = os.stat(entry.path, follow_symlinks=False)
+                        # A directory without an inode number can't be told
+                        # apart from others, so it bypasses the cache.
+                        key = (st.st_dev, st.st_ino) if st.st_ino else None
+                        cached = subtree_cache.get(key) if key is not None else None
+                        if cached is None and folder_dev is not None and st.st_dev != folder_dev:
+                            cached = self._mount_usage(entry.path)
+                            if cached is not None and key is not None:
+                                subtree_cache[key] = cached
+                        if cached is not None:
+                            names.append(entry.name)
+                            sizes.append(cached[0])
+                            counts.append(cached[1])
+                            total_size += cached[0]
+                            total_files += cached[1]
+                        else:
+                            subdirs.append((entry, key))
+                except OSError as e:
+                    self._handle_scan_error(entry, e)
+
+        # Subdirectory walks spend their time blocked in scandir/stat, which
+        # release the GIL, so running them on threads overlaps the I/O. Each
+        # task walks a bounded batch of directories and hands back what is
+        # left, so one deep subtree is spread over every worker instead of
+        # pinning a single thread.
+        #
+        # With scandir_rs installed each subtree is walked by its Rust thread
+        # pool instead, so a task always covers the whole subdirectory. It
+        # doesn't report link counts, so hardlink dedupe always uses ours.
+        if note_link is not None:
+            walks = {
+                entry.name: partial(self._walk_size_count,
+                                    hardlink=partial(note_link, entry.name))
+                for entry, _ in subdirs
+            }
+        else:
+            walk = self._walk_size_count_rs if scandir_rs else self._walk_size_count
+            walks = {entry.name: walk for entry, _ in subdirs}
+        totals = {entry.name: [0, 0] for entry, _ in subdirs}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = {
+                executor.submit(walks[entry.name], [entry.path]): entry.name
+                for entry, _ in subdirs
+            }
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = pending.pop(future)
+                    size_this_batch, filecount_this_batch, remaining = future.result()
+                    totals[name][0] += size_this_batch
+                    totals[name][1] += filecount_this_batch
+                    total_files += filecount_this_batch
+                    total_size += size_this_batch
+
+                    chunks = min(len(remaining), self.max_workers)
+                    for i in range(chunks):
+                        pending[executor.submit(walks[name], remaining[i::chunks])] = name
+
+                # Redraw at most every PROGRESS_INTERVAL seconds; a terminal
+                # write per batch is measurable on fast local disks.
+                if progress:
+                    self._report_progress(progress_prefix, total_files, total_size)
+
+        if links:
+            for name, size in links.values():
+                if name in totals:
+                    totals[name][0] += size
+                    totals[name][1] += 1
+                else:
+                    sizes[file_rows[name]] += size
+                    counts[file_rows[name]] += 1
+                total_size += size
+                total_files += 1
+
+        for entry, key in subdirs:
+            size_this_item, filecount_this_item = totals[entry.name]
+            if key is not None:
+                subtree_cache[key] = (size_this_item, filecount_this_item)
+            names.append(entry.name)
+            sizes.append(size_this_item)
+            counts.append(filecount_this_item)
+            self._dbg("Scanned directory %s: %d files, %d bytes",
+                      entry.name, filecount_this_item, size_this_item)
+
+        digests = None
+        if self.hash_contents:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                digests = array('Q', executor.map(
+                    self._hash_entry, [os.path.join(folder, name) for name in names]
+                ))
+
+        self._dbg("FINISH: scanning %s: %d files, %d bytes", folder, total_files, total_size)
         
-        if self.verbose_level >= 1:
-            print(
-                f"\rCompleted {folder:<30}, "
-                f"Total items: {counted_files_total:>10,} "
-                f"Total size: {total_file_size_so_far:>10,}"
-            )
-            print(f"\r{' ' * 120}", end="", flush=True)
-            print("\r", end="", flush=True)
+        if progress:
+            # One write and one flush for the whole completion block.
+            with self._print_lock:
+                sys.stderr.write(
+                    f"\rCompleted {folder:<30}, "
+                    f"Total items: {total_files:>10,} "
+                    f"Total size: {total_size:>10,}\n"
+                    f"\r{' ' * 120}\r"
+                )
+                sys.stderr.flush()
         
-        return entries
+        return ScanResult(names, sizes, counts, digests)
+
+    def _report_progress(self, prefix, total_files, total_size):
+        """Redraw the progress line unless it was drawn in the last PROGRESS_INTERVAL."""
+        now = time.monotonic()
+        if now - self._last_progress <= PROGRESS_INTERVAL:
+            return
+        with self._print_lock:
+            if now - self._last_progress <= PROGRESS_INTERVAL:
+                return
+            self._last_progress = now
+            sys.stderr.write(
+                f"{prefix}Total items: {total_files:>10,} "
+                f"Total size: {total_size:>10,}"
+            )
+            sys.stderr.flush()
+
+    def _mount_usage(self, path):
+        """Return (bytes used, inodes used) of the filesystem mounted at path.
+
+        Used by --fast-mounts in place of walking a mount point. These are
+        filesystem-wide usage figures: allocated blocks rather than summed
+        file sizes, and inodes including directories. Returns None, so the
+        caller walks as usual, when path isn't the root of a mounted
+        filesystem (a btrfs subvolume, a bind mount of a subdirectory, or no
+        mount table to check against) or statvfs is unavailable or fails.
+        """
+        if os.path.realpath(path) not in self._filesystem_roots:
+            self._dbg("%s is not the root of a mounted filesystem, walking it", path)
+            return None
+        try:
+            vfs = os.statvfs(path)
+        except (AttributeError, OSError) as e:
+            self._dbg("Cannot statvfs %s, walking it instead: %s", path, e)
+            return None
+        return (vfs.f_blocks - vfs.f_bfree) * vfs.f_frsize, vfs.f_files - vfs.f_ffree
+
+    def _handle_scan_error(self, entry, exc):
+        """Report a first level entry that could not be stat'ed."""
+        self._dbg("Warning: Cannot access %s: %s", entry.name, exc)
+
+    def _hash_entry(self, path):
+        """Return a digest of the contents of the regular files at or below path.
+
+        Each file contributes its path relative to path and its content
+        digest, in sorted order, so the result doesn't depend on the order
+        directories are read in.
+        """
+        try:
+            if stat.S_ISREG(os.stat(path, follow_symlinks=False).st_mode):
+                return self._hash_file(path)
+        except OSError as e:
+            self._dbg("Warning: Cannot hash %s: %s", path, e)
+            return 0
+
+        files = []
+        stack = ['']
+        while stack:
+            rel_dir = stack.pop()
+            try:
+                with os.scandir(os.path.join(path, rel_dir)) as dir_entries:
+                    for entry in dir_entries:
+                        rel_path = os.path.join(rel_dir, entry.name)
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(rel_path)
+                        elif entry.is_file(follow_symlinks=False):
+                            files.append(rel_path)
+            except OSError as e:
+                self._dbg("Warning: Cannot hash %s: %s", rel_dir, e)
+        files.sort()
+
+        digest = _new_hash()
+        for rel_path in files:
+            try:
+                file_digest = self._hash_file(os.path.join(path, rel_path))
+            except OSError as e:
+                self._dbg("Warning: Cannot hash %s: %s", rel_path, e)
+                continue
+            digest.update(os.fsencode(rel_path) + b'\0')
+            digest.update(file_digest.to_bytes(8, 'little'))
+        return int.from_bytes(digest.digest(), 'little')
 
-    def _get_dir_size(self, folder, parent_folder=None, num_sized_files_total=0):
-        """Calculate directory size recursively."""
-        if self.verbose_level >= 2:
-            DebugUtils.debug_with_counters("START: sizing")
-        
-        num_sized_files_this_folder = 0
-        size_this_file = 0
+    @staticmethod
+    def _hash_file(path):
+        """Return a digest of the contents of the file at path."""
+        digest = _new_hash()
+        with open(path, 'rb', buffering=0) as f:
+            while True:
+                chunk = f.read(HASH_CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+        return int.from_bytes(digest.digest(), 'little')
+
+    @staticmethod
+    def _hardlink_recorder(links):
+        """Return a thread-safe note_link(name, dev, ino, size) filling links.
+
+        links maps (dev, ino) to (name, size), keeping the smallest
+        first-level name the inode was seen under.
+        """
+        lock = threading.Lock()
+
+        def note_link(name, dev, ino, size):
+            key = (dev, ino)
+            with lock:
+                owner = links.get(key)
+                if owner is None or name < owner[0]:
+                    links[key] = (name, size)
+
+        return note_link
+
+    def _walk_size_count(self, stack, hardlink=None):
+        """Size and count the files below the directories on stack.
+
+        At most WALK_BATCH_DIRS directories are read; the unvisited rest of
+        the stack is returned alongside the totals so the caller can share
+        it out between workers. hardlink, when given, receives the files
+        with more than one link as in walk_size_count.
+        """
+        self._dbg("START: sizing and counting %d directories", len(stack))
+
+        statx_size = _STATX.size if _STATX.available and SCANDIR_DIR_FD else None
+        total_size_this_folder, filecount_this_folder, stack = walk_size_count(
+            stack, WALK_BATCH_DIRS, statx_size, hardlink
+        )
+        self._dbg("FINISH: sizing and counting: %d files, %d bytes, %d directories left",
+                  filecount_this_folder, total_size_this_folder, len(stack))
+
+        return total_size_this_folder, filecount_this_folder, stack
+
+    def _walk_size_count_rs(self, stack):
+        """Size and count the files below the directories on stack using scandir_rs."""
         total_size_this_folder = 0
+        filecount_this_folder = 0
         
-        for root, dirs, files in os.walk(folder):
-            for f in files:
-                fp = os.path.join(root, f)
-                try:
-                    num_sized_files_total += 1
-                    num_sized_files_this_folder += 1
-                    if self.verbose_level >= 2 and (
-                        num_sized_files_total % 100 == 0 
-                        or num_sized_files_total == 1 
-                        or total_size_this_folder >= 100
-                    ):
-                        DebugUtils.debug_with_counters("Processed 100 entries")
-                    
-                    size_this_file = os.path.getsize(fp)
-                    total_size_this_folder += size_this_file
-                except Exception:
-                    pass
-                
-                if self.verbose_level >= 1 and (
-                    num_sized_files_total % 100 == 0 
-                    or num_sized_files_this_folder > 100
-                ):
-                    if self.verbose_level >= 2:
-                        DebugUtils.debug_with_counters("processed 100 entries")
-                    print(
-                        f"\rProcessing {folder:<30}, "
-                        f"Total items: {num_sized_files_total:>10,}, "
-                        f"Total size: {num_sized_files_total:>10,}", 
-                        end="", flush=True
-                    )
-
-        return total_size_this_folder, num_sized_files_total
-
-    def _get_file_count(self, folder, parent_folder=None, counted_files_total=0):
-        """Count files in directory recursively."""
-        if self.verbose_level >= 2:
-            DebugUtils.debug_with_counters("START: counting")
-
-        total_count_this_folder = 0
-        for _, _, files in os.walk(folder):
-            total_count_this_folder += len(files)
-            counted_files_total += len(files)
-            if self.verbose_level >= 2 and (
-                counted_files_total % 100 == 0 
-                or counted_files_total == 1 
-                or total_count_this_folder >= 100
-            ):
-                DebugUtils.debug_with_counters("Processed 100 entries")
+        for folder in stack:
+            for entry in scandir_rs.Scandir(folder, return_type=scandir_rs.ReturnType.Base, store=False):
+                if entry.is_file:
+                    total_size_this_folder += entry.st_size
+                    filecount_this_folder += 1
         
-        if self.verbose_level >= 2:
-            DebugUtils.debug_with_counters("FINISH: counting")
-
-        return total_count_this_folder, counted_files_total
+        return total_size_this_folder, filecount_this_folder, []
 
 
 class ComparisonData:
@@ -220,62 +544,98 @@ class ComparisonData:
         
     def build_data(self):
         """Build the comparison data from the two folder entries."""
-        all_names = sorted(set(self.entries1.keys()) | set(self.entries2.keys()))
-
-        self.data = []
-        total_size1 = 0
-        total_size2 = 0
-        total_fc1 = 0
-        total_fc2 = 0
-        size_diff_count = 0
-        file_diff_count = 0
-        diff_count = 0
-
-        for name in all_names:
-            size1, fc1 = self.entries1.get(name, (0, 0))
-            size2, fc2 = self.entries2.get(name, (0, 0))
-            sizediff = '*' if size1 != size2 else ''
-            filediff = '*' if fc1 != fc2 else ''
-            diff = '**' if fc1 != fc2 or size1 != size2 else ''
-
-            if not self.only_diffs or diff:
-                self.data.append({
-                    'Name': name,
-                    'Size1': size1,
-                    'Size2': size2,
-                    'SD': sizediff,
-                    'Filecount1': fc1,
-                    'Filecount2': fc2,
-                    'CD': filediff,
-                    'DIFF': diff
-                })
-
-            total_size1 += size1
-            total_size2 += size2
-            total_fc1 += fc1
-            total_fc2 += fc2
-
-            if size1 != size2:
-                size_diff_count += 1
-            if fc1 != fc2:
-                file_diff_count += 1
-            if size1 != size2 or fc1 != fc2:
-                diff_count += 1
-
-        totals_row = {
-            'Name': "TOTAL",
-            'Size1': total_size1,
-            'Size2': total_size2,
-            'SD': size_diff_count,
-            'Filecount1': total_fc1,
-            'Filecount2': total_fc2,
-            'CD': file_diff_count,
-            'DIFF': diff_count
-        }
+        if self.only_diffs and self.entries1 == self.entries2:
+            # Identical scans (e.g. a verified mirror) have no rows to show;
+            # only the totals are needed.
+            size = sum(self.entries1.sizes)
+            filecount = sum(self.entries1.counts)
+            self.data = [ComparisonRow("TOTAL", size, size, 0, filecount, filecount, 0, 0)]
+            return self.data
+
+        # Each side is sorted once; the union is a merge of the two sorted
+        # name lists and both sides are aligned on it. Everything after
+        # this is vectorised.
+        names1, columns1 = self._sort_side(self.entries1)
+        names2, columns2 = self._sort_side(self.entries2)
+        names = self._merge_names(names1, names2)
+        s1, f1, d1 = self._align(names1, columns1, names)
+        s2, f2, d2 = self._align(names2, columns2, names)
+
+        size_diff = s1 != s2
+        file_diff = f1 != f2
+        any_diff = size_diff | file_diff
+        if d1 is not None and d2 is not None:
+            # Same sizes and counts but different contents only show in DIFF.
+            any_diff |= d1 != d2
+
+        columns = [names, s1, s2, np.where(size_diff, '*', ''), f1, f2,
+                   np.where(file_diff, '*', ''), np.where(any_diff, '**', '')]
+        if self.only_diffs:
+            columns = [col[any_diff] for col in columns]
+        # Build the rows column-wise; tolist() also turns numpy scalars back
+        # into plain Python ints and strs for the formatters.
+        self.data = list(map(ComparisonRow._make, zip(*(col.tolist() for col in columns))))
+
+        totals_row = ComparisonRow(
+            Name="TOTAL",
+            Size1=int(s1.sum()),
+            Size2=int(s2.sum()),
+            SD=int(size_diff.sum()),
+            Filecount1=int(f1.sum()),
+            Filecount2=int(f2.sum()),
+            CD=int(file_diff.sum()),
+            DIFF=int(any_diff.sum())
+        )
 
         self.data.append(totals_row)
         return self.data
 
+    @staticmethod
+    def _sort_side(entries):
+        """Return entries' names sorted, with its columns in the same order."""
+        names = np.array(entries.names, dtype=object)
+        order = np.argsort(names)
+        columns = [
+            np.frombuffer(col, dtype=np.dtype(col.typecode))[order]
+            for col in (entries.sizes, entries.counts, entries.digests)
+            if col is not None
+        ]
+        return names[order], columns
+
+    @staticmethod
+    def _merge_names(names1, names2):
+        """Return the sorted union of two sorted name arrays."""
+        merged = np.concatenate((names1, names2))
+        # numpy's stable sort for object arrays is timsort, which finds the
+        # two sorted runs and merges them in linear time.
+        merged.sort(kind='stable')
+        if not len(merged):
+            return merged
+        keep = np.empty(len(merged), dtype=bool)
+        keep[0] = True
+        np.not_equal(merged[1:], merged[:-1], out=keep[1:])
+        return merged[keep]
+
+    @staticmethod
+    def _align(own_names, columns, names):
+        """Return sizes, counts and digests laid out along names.
+
+        own_names and names are sorted, and own_names is a subset of names.
+        Names missing from own_names get zeros; digests is None when the
+        side was scanned without --hash.
+        """
+        aligned = [np.zeros(len(names), dtype=col.dtype) for col in columns]
+
+        if len(own_names):
+            idx = np.searchsorted(own_names, names)
+            idx[idx == len(own_names)] = 0
+            found = own_names[idx] == names
+            for out, col in zip(aligned, columns):
+                out[found] = col[idx[found]]
+
+        aligned += [None] * (3 - len(aligned))
+        return aligned
+
 
 class OutputFormatter:
     """Base class for output formatters."""
@@ -287,26 +647,48 @@ class OutputFormatter:
         """Format and output the comparison data."""
         raise NotImplementedError("Subclasses must implement format_output")
 
+    @staticmethod
+    def _row_cells(entry):
+        """Return an entry row as display strings.
+
+        Sizes and counts of entry rows are always ints, so every cell's
+        format is fixed and no per-cell type checks are needed.
+        """
+        return (
+            entry.Name,
+            f"{entry.Size1:,}",
+            f"{entry.Size2:,}",
+            entry.SD,
+            f"{entry.Filecount1:,}",
+            f"{entry.Filecount2:,}",
+            entry.CD,
+            entry.DIFF
+        )
+
+    @staticmethod
+    def _totals_cells(totals):
+        """Return the totals row as display strings."""
+        return (totals.Name,) + tuple(f"{value:,}" for value in totals[1:])
+
 
 class RichFormatter(OutputFormatter):
     """Rich console output formatter with colors and styling."""
     
     def format_output(self, data, folder1, folder2):
         """Format and output using Rich console."""
-        if self.verbose_level >= 1:
-            DebugUtils.debug_print("Using rich console output")
+        # Imported here so the other output modes don't pay for rich.
+        from rich.console import Console
+        from rich.table import Table
+        from rich.text import Text
+
+        log.info("Using rich console output")
         
         console = Console()
 
-        markdown_content = f"""# Folder Comparison Report
-
-**Folder 1:** `{folder1}`  
-**Folder 2:** `{folder2}`
-"""
-
         totals = data[-1] if data else None
 
         table = Table(
+            title="Folder Comparison Report", title_style="bold",
             show_header=True, show_footer=True, 
             header_style="bold", footer_style="bold"
         )
@@ -315,142 +697,72 @@ class RichFormatter(OutputFormatter):
         table.add_column(
             "Name", style="cyan", header_style="cyan", footer_style="cyan", 
             no_wrap=True, justify="left",
-            footer=totals['Name'] if totals else None
+            footer=totals.Name if totals else None
         )
         
         # Format footer values for numeric columns
-        for col_name, col_data, style in [
-            ("Size1", "Size1", "green"), ("Size2", "Size2", "green"), ("SD", "SD", "green"),
-            ("Filecount1", "Filecount1", "yellow"), ("Filecount2", "Filecount2", "yellow"),
-            ("CD", "CD", "yellow"), ("DIFF", "DIFF", "red")
+        for col_name, style in [
+            ("Size1", "green"), ("Size2", "green"), ("SD", "green"),
+            ("Filecount1", "yellow"), ("Filecount2", "yellow"),
+            ("CD", "yellow"), ("DIFF", "red")
         ]:
             footer_val = None
-            if totals and isinstance(totals[col_data], (int, float)):
-                footer_val = f"{totals[col_data]:,}"
+            if totals and isinstance(getattr(totals, col_name), (int, float)):
+                footer_val = f"{getattr(totals, col_name):,}"
             
             table.add_column(
                 col_name, style=style, header_style=style, footer_style=style,
                 justify="right", footer=footer_val
             )
 
-        for entry in data:
-            if entry['Name'] != 'TOTAL':
-                size1_formatted = f"{entry['Size1']:,}" if entry['Size1'] != 'N/A' else 'N/A'
-                size2_formatted = f"{entry['Size2']:,}" if entry['Size2'] != 'N/A' else 'N/A'
-                filecount1_formatted = f"{entry['Filecount1']:,}" if entry['Filecount1'] != 'N/A' else 'N/A'
-                filecount2_formatted = f"{entry['Filecount2']:,}" if entry['Filecount2'] != 'N/A' else 'N/A'
-
-                sd_formatted = (f"{entry['SD']:,}" if entry['Name'] == 'TOTAL' 
-                              and isinstance(entry['SD'], (int, float)) else str(entry['SD']))
-                cd_formatted = (f"{entry['CD']:,}" if entry['Name'] == 'TOTAL' 
-                              and isinstance(entry['CD'], (int, float)) else str(entry['CD']))
-                diff_formatted = (f"{entry['DIFF']:,}" if entry['Name'] == 'TOTAL' 
-                                and isinstance(entry['DIFF'], (int, float)) else str(entry['DIFF']))
-
-                table.add_row(
-                    str(entry['Name']),
-                    size1_formatted,
-                    size2_formatted,
-                    sd_formatted,
-                    filecount1_formatted,
-                    filecount2_formatted,
-                    cd_formatted,
-                    diff_formatted
-                )
+        # The last row is the totals row, already shown in the footer.
+        for entry in data[:-1]:
+            table.add_row(*self._row_cells(entry))
 
         print("\n")
-        md = Markdown(markdown_content)
-        console.print(md)
+        console.print(Text.assemble(("Folder 1: ", "bold"), str(folder1)))
+        console.print(Text.assemble(("Folder 2: ", "bold"), str(folder2)))
         console.print(table)
 
 
 class PlainFormatter(OutputFormatter):
     """Plain text formatter with Unicode box drawing characters."""
+
+    _TOP = str.maketrans('|-:', '┬──')
+    _MIDDLE = str.maketrans('|-:', '┼──')
+    _TOTALS = str.maketrans('|-:', '╪══')
+    _BOTTOM = str.maketrans('|-:', '┴──')
     
     def format_output(self, data, folder1, folder2):
         """Format and output using plain markdown with Unicode borders."""
-        if self.verbose_level >= 1:
-            DebugUtils.debug_print("Using plain markdown output")
+        log.info("Using plain markdown output")
         
         markdown_table = self._format_markdown_table(data)
-        
+
+        # Every border is the markdown separator line with its '|' and '-'
+        # mapped to box drawing characters, so each is one translate().
         lines = markdown_table.split('\n')
-        separator_line = lines[1] if len(lines) > 1 else "│" + "─" * 118 + "│"
-        
-        top_border = separator_line.replace('|', '┬')
-        top_border = top_border.replace('-', '─')
+        rule = lines[1][1:-1]
+        top_border = '┌' + rule.translate(self._TOP) + '┐'
+        lines[1] = '├' + rule.translate(self._MIDDLE) + '┤'
+        lines.insert(len(lines) - 1, '╞' + rule.translate(self._TOTALS) + '╡')
+        bottom_border = '└' + rule.translate(self._BOTTOM) + '┘'
 
-        if top_border.startswith('┬'):
-            top_border = '┌' + top_border[1:]
-        if top_border.endswith('┬'):
-            top_border = top_border[:-1] + '┐'
-        
-        bottom_border = separator_line.replace('|', '┴')
-        bottom_border = bottom_border.replace('-', '─')
-        
-        if bottom_border.startswith('┴'):
-            bottom_border = '└' + bottom_border[1:]
-        if bottom_border.endswith('┴'):
-            bottom_border = bottom_border[:-1] + '┘'
-        
-        if len(lines) > 1:
-            header_separator = lines[1].replace('-', '─')
-            parts = header_separator.split('|')
-            if len(parts) > 2:
-                new_parts = []
-                for i, part in enumerate(parts):
-                    if i == 0:
-                        new_parts.append(part)
-                    elif i == 1:
-                        new_parts.append(part)
-                    elif i == len(parts) - 1:
-                        new_parts.append(part)
-                    else:
-                        new_parts.append(part)
-                result = new_parts[0] + '├'
-                for i in range(1, len(new_parts) - 2):
-                    result += new_parts[i] + '┼'
-                result += new_parts[-2] + '┤' + new_parts[-1]
-                new_header_separator = result
-            else:
-                new_header_separator = header_separator.replace('|', '┼')
-
-            totals_separator = new_header_separator
-            for old, new in [['─', '═'], ['┼', '╪'], ['├', '╞'], ['┤', '╡'], 
-                           ['┬', '╤'], ['┴', '╧']]:
-                totals_separator = totals_separator.replace(old, new)
-
-            lines[1] = new_header_separator
-            lines.insert(len(lines)-1, totals_separator)
-            markdown_table = '\n'.join(lines)
-        
-        markdown_table = markdown_table.replace('|', '│')
-        
         print(top_border)
-        print(markdown_table)
+        print('\n'.join(lines).replace('|', '│'))
         print(bottom_border)
 
     def _format_markdown_table(self, data):
         """Format the data as a properly aligned markdown table."""
+        from tabulate import tabulate
         
-        df = pd.DataFrame(data)
-
-        df_formatted = df.copy()
-        for col in ['Size1', 'Size2', 'Filecount1', 'Filecount2']:
-            df_formatted[col] = df[col].apply(
-                lambda x: f"{x:,}" if isinstance(x, (int, float)) else str(x)
-            )
-
-        for col in ['SD', 'CD', 'DIFF']:
-            df_formatted[col] = df.apply(
-                lambda row: f"{row[col]:,}" 
-                if row['Name'] == 'TOTAL' and isinstance(row[col], (int, float)) 
-                else str(row[col]), 
-                axis=1
-            )
+        # Cells arrive preformatted, so tabulate's per-cell number parsing
+        # is switched off.
+        rows = [self._row_cells(entry) for entry in data[:-1]]
+        rows.append(self._totals_cells(data[-1]))
 
         markdown_output = tabulate(
-            df_formatted, headers='keys', tablefmt='github', showindex=False,
+            rows, headers=ComparisonRow._fields, tablefmt='github', disable_numparse=True,
             colalign=('left', 'right', 'right', 'right', 'right', 'right', 'right', 'right')
         )
 
@@ -474,25 +786,13 @@ class CsvFormatter(OutputFormatter):
     
     def format_output(self, data, folder1, folder2):
         """Format and output as CSV."""
-        if self.verbose_level >= 1:
-            DebugUtils.debug_print("Using CSV output")
+        log.info("Using CSV output")
         
         output = io.StringIO()
         writer = csv.writer(output)
         
-        writer.writerow(['Name', 'Size1', 'Size2', 'SD', 'Filecount1', 'Filecount2', 'CD', 'DIFF'])
-        
-        for entry in data:
-            writer.writerow([
-                entry['Name'],
-                entry['Size1'],
-                entry['Size2'],
-                entry['SD'],
-                entry['Filecount1'],
-                entry['Filecount2'],
-                entry['CD'],
-                entry['DIFF']
-            ])
+        writer.writerow(ComparisonRow._fields)
+        writer.writerows(data)
         
         csv_output = output.getvalue().strip()
         print(csv_output)
@@ -505,29 +805,39 @@ class FolderComparator:
         self.folder1 = folder1
         self.folder2 = folder2
         self.args = args
-        self.scanner = FolderScanner(verbose_level=args.verbose)
+        self.scanner = FolderScanner(
+            verbose_level=args.verbose, max_workers=args.workers,
+            hash_contents=args.hash, fast_mounts=args.fast_mounts,
+            dedupe_hardlinks=args.dedupe_hardlinks
+        )
         
     def compare(self):
         """Run the complete folder comparison."""
-        entries1 = self.scanner.scan_folder(self.folder1)
-        entries2 = self.scanner.scan_folder(self.folder2)
+        if os.path.samefile(self.folder1, self.folder2):
+            entries1 = entries2 = self.scanner.scan_folder(self.folder1)
+        else:
+            # The two trees are often on different devices, so scan them side by side.
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                future1 = executor.submit(self.scanner.scan_folder, self.folder1)
+                future2 = executor.submit(self.scanner.scan_folder, self.folder2)
+                entries1, entries2 = future1.result(), future2.result()
         
         comparison_data = ComparisonData(entries1, entries2, self.args.only_diffs)
         data = comparison_data.build_data()
         
-        formatter = self._create_formatter()
+        formatter = self._create_formatter(len(data) - 1)
         formatter.format_output(data, self.folder1, self.folder2)
     
-    def _create_formatter(self):
+    def _create_formatter(self, row_count):
         """Create the appropriate output formatter based on arguments."""
         if self.args.csv:
             return CsvFormatter(self.args.verbose)
-        elif self._should_use_rich_output():
+        elif self._should_use_rich_output(row_count):
             return RichFormatter(self.args.verbose)
         else:
             return PlainFormatter(self.args.verbose)
     
-    def _should_use_rich_output(self):
+    def _should_use_rich_output(self, row_count):
         """Determine whether to use rich output formatting."""
         if self.args.csv:
             return False
@@ -538,7 +848,7 @@ class FolderComparator:
         if self.args.rich:
             return True
 
-        return sys.stdout.isatty()
+        return _STDOUT_IS_TTY and row_count <= RICH_AUTO_MAX_ROWS
 
 
 def parse_arguments():
@@ -565,6 +875,20 @@ def parse_arguments():
                        help='Increase verbosity: -v for progress, -vv for debug output')
     parser.add_argument('-d', '--only-diffs', action='store_true', 
                        help='Show only entries with differences')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                       help='Number of threads used to walk subdirectories '
+                            f'(default: {FolderScanner.default_workers()})')
+    parser.add_argument('-H', '--hash', action='store_true', default=False,
+                       help='Also compare file contents; reads every file '
+                            '(uses xxhash if installed)')
+    parser.add_argument('--fast-mounts', action='store_true', default=False,
+                       help='Report first-level subdirectories that are mount points '
+                            'from statvfs usage instead of walking them (used space '
+                            'and inodes, not summed file sizes; Linux only)')
+    parser.add_argument('--dedupe-hardlinks', action='store_true', default=False,
+                       help='Count each hardlinked file once per folder, like du '
+                            '(off by default: copies made without preserving '
+                            'hardlinks would then differ)')
 
     return parser.parse_args()
 
@@ -576,6 +900,9 @@ def validate_and_get_folders(args, parser):
     if not folder1 or not folder2:
         parser.error('Two folders must be specified either positionally or using -f1/-f2 flags')
 
+    if args.workers is not None and args.workers < 1:
+        parser.error('--workers must be at least 1')
+
     if not os.path.exists(folder1):
         parser.error(f'Folder1 does not exist: {folder1}')
     if not os.path.exists(folder2):
@@ -583,14 +910,45 @@ def validate_and_get_folders(args, parser):
 
     return folder1, folder2
 
+def raise_open_file_limit(max_workers):
+    """Raise the soft open-file limit if the scanner threads could exceed it.
+
+    Each walker thread holds a directory fd and its scandir handle, and
+    both folders are scanned at once.
+    """
+    if resource is None:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    needed = 4 * max_workers + 64
+    if soft == resource.RLIM_INFINITY or soft >= needed:
+        return
+    if hard != resource.RLIM_INFINITY:
+        needed = min(needed, hard)
+    try:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (needed, hard))
+    except (ValueError, OSError) as e:
+        log.debug("Cannot raise the open file limit to %d: %s", needed, e)
+
+def configure_logging(verbose_level):
+    """Log -v messages and -vv debug output to stderr."""
+    if verbose_level >= 2:
+        level = logging.DEBUG
+    elif verbose_level >= 1:
+        level = logging.INFO
+    else:
+        level = logging.WARNING
+    logging.basicConfig(level=level, format="(%(funcName)-25s:%(lineno)3d) %(message)s")
+
 def main():
     """Main function to run the folder comparison tool."""
     args = parse_arguments()
+    configure_logging(args.verbose)
     parser = argparse.ArgumentParser(prog='chksync')
 
     folder1, folder2 = validate_and_get_folders(args, parser)
 
     comparator = FolderComparator(folder1, folder2, args)
+    raise_open_file_limit(comparator.scanner.max_workers)
     comparator.compare()
 
 
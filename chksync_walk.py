@@ -0,0 +1,87 @@
+"""Hot directory-walking loop for chksync.
+
+Kept in its own module, free of chksync's other imports, so it can be
+compiled with mypyc (see build-and-deploy.sh). When a compiled extension
+sits next to this file, Python imports it in preference to the source;
+otherwise the pure-Python version below is used.
+"""
+
+import os
+from typing import Callable, List, Optional, Tuple
+
+# Where scandir accepts a directory fd, files are stat'ed relative to their
+# already-open parent, so the kernel resolves one name instead of the full path.
+SCANDIR_DIR_FD: bool = os.scandir in os.supports_fd
+O_DIRECTORY: int = os.O_RDONLY | getattr(os, 'O_DIRECTORY', 0) | getattr(os, 'O_CLOEXEC', 0)
+
+
+def walk_size_count(
+    stack: List[str],
+    max_dirs: int,
+    statx_size: Optional[Callable[[str, int], int]] = None,
+    hardlink: Optional[Callable[[int, int, int], None]] = None,
+) -> Tuple[int, int, List[str]]:
+    """Size and count the regular files below the directories on stack.
+
+    At most max_dirs directories are read; the unvisited rest of the stack
+    is returned alongside the totals. statx_size(name, dir_fd), when given,
+    replaces DirEntry.stat() for file sizes and requires SCANDIR_DIR_FD.
+    hardlink(st_dev, st_ino, st_size), when given, is called for every file
+    with more than one link in place of counting it, so the caller can
+    count each inode once.
+    """
+    total_size = 0
+    file_count = 0
+    budget = max_dirs
+
+    while stack and budget:
+        budget -= 1
+        path = stack.pop()
+        try:
+            dir_fd = os.open(path, O_DIRECTORY) if SCANDIR_DIR_FD else -1
+        except OSError:
+            continue
+        try:
+            # Entries from an fd scandir carry only their name; entry.stat()
+            # is then an fstatat() relative to dir_fd.
+            with os.scandir(path if dir_fd < 0 else dir_fd) as dir_entries:
+                # The try sits outside the entry loop so error-free
+                # directories set up one handler, not one per entry. An
+                # entry that fails (e.g. removed since readdir) is skipped
+                # by resuming the same iterator; a readdir failure closes
+                # the iterator, which ends the loop.
+                while True:
+                    try:
+                        for entry in dir_entries:
+                            if entry.is_dir(follow_symlinks=False):
+                                stack.append(os.path.join(path, entry.name))
+                            elif entry.is_file(follow_symlinks=False):
+                                if hardlink is not None:
+                                    # Link counts need a full stat, not statx_size.
+                                    st = entry.stat(follow_symlinks=False)
+                                    if not st.st_ino:
+                                        # Windows leaves st_ino, st_dev and st_nlink
+                                        # of DirEntry.stat() at 0.
+                                        if dir_fd >= 0:
+                                            st = os.stat(entry.name, dir_fd=dir_fd, follow_symlinks=False)
+                                        else:
+                                            st = os.stat(entry.path, follow_symlinks=False)
+                                    if st.st_nlink > 1 and st.st_ino:
+                                        hardlink(st.st_dev, st.st_ino, st.st_size)
+                                        continue
+                                    total_size += st.st_size
+                                elif statx_size is not None:
+                                    total_size += statx_size(entry.name, dir_fd)
+                                else:
+                                    total_size += entry.stat(follow_symlinks=False).st_size
+                                file_count += 1
+                        break
+                    except OSError:
+                        pass
+        except OSError:
+            pass
+        finally:
+            if dir_fd >= 0:
+                os.close(dir_fd)
+
+    return total_size, file_count, stack
@@ -4,146 +4,315 @@ Script to create test files and directories for the chksync project.
 This recreates the test structure that was removed from git tracking.
 """
 
+import argparse
+import io
+import logging
 import os
+import sys
+import tarfile
+import time
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 
+log = logging.getLogger("create_test_files")
+
+
+class _QueuedStdoutHandler(logging.Handler):
+    """Collect formatted records and write them to stdout in one call on flush()."""
+
+    def __init__(self):
+        super().__init__()
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(self.format(record) + "\n")
+
+    def flush(self):
+        self.acquire()
+        try:
+            if self.lines:
+                sys.stdout.write("".join(self.lines))
+                sys.stdout.flush()
+                self.lines.clear()
+        finally:
+            self.release()
+
+
+# Progress records are collected per phase and written out by _flush_log().
+_stdout_handler = _QueuedStdoutHandler()
+
+
+def _flush_log():
+    """Write the queued progress lines to stdout at once."""
+    _stdout_handler.flush()
+
+
+# Pre-encoded contents of the generated mixed_content files.
+_UNICODE_BYTES = "Unicode: αβγδε ñáéíóú 中文 🚀".encode("utf-8")
+_NUMBERS_BYTES = b"\n".join(b"%d" % i for i in range(1, 101))
+_LONG_LINE = b"A" * 1000
+
+# Contents of the basic test folders.
+_FOLDER1_FILES = {
+    "common.txt": b"This is a common file in folder 1\nShared content\nLine 3",
+    "file1.txt": b"Content of file1 in test_folder1\nUnique to folder 1",
+    "unique1.txt": b"This file only exists in test_folder1\nSpecial content for testing",
+}
+
+_SUBDIR1_FILES = {
+    "sub_file.txt": b"Subdirectory file content\nNested file in folder1/subdir1",
+    "sub_file1.txt": b"Another subdirectory file\nOnly in folder1",
+}
+
+_FOLDER2_FILES = {
+    "common.txt": b"This is a common file in folder 2\nShared content\nLine 3",  # Same size as folder1, different content
+    "file1.txt": b"Content of file1 in test_folder2\nDifferent from folder 1",
+    "unique2.txt": b"This file only exists in test_folder2\nSpecial content for testing folder 2",
+}
+
+_SUBDIR2_FILES = {
+    "sub_file.txt": b"Subdirectory file content\nNested file in folder2/subdir1",  # Same size as folder1, different content
+    "sub_file1.txt": b"Another subdirectory file\nOnly in folder2, different content",
+    "sub_file2.txt": b"Extra file in folder2 subdir\nUnique to test_folder2/subdir1",
+}
+
+_DUMMY_ZIP = b"PK\x03\x04\x14\x00\x00\x00\x08\x00"  # Minimal zip header
+
+# Various file types and contents for mixed_content
+_MIXED_FILES = {
+    "empty_file.txt": b"",
+    "single_line.txt": b"Single line file",
+    "multi_line.txt": b"Line 1\nLine 2\nLine 3\nLine 4",
+    "unicode_content.txt": _UNICODE_BYTES,
+    "numbers.txt": _NUMBERS_BYTES,
+    "whitespace.txt": b"   \n\t\n   spaces and tabs   \n",
+    "long_line.txt": _LONG_LINE,
+}
+
+# Numbered files of the large folders: 1-250 plus some different numbering
+# patterns for testing sorting. 10 and 100 are already in 1-250, so the set
+# keeps them from being written twice.
+_LARGE_FILE_NUMBERS = sorted({*range(1, 251), 10, 100, 1000, 10000, *range(1001, 1100)})
+
+# Directories already created by this run, so repeats skip the mkdir syscall.
+_seen_dirs = set()
+
+
+def _mkdir(path):
+    """Create path and any missing parents, once per run."""
+    if path not in _seen_dirs:
+        os.makedirs(path, exist_ok=True)
+        _seen_dirs.add(path)
+        _seen_dirs.update(path.parents)
+
+
+def _note_existing_dirs(parent):
+    """Mark parent and its existing subdirectories as created.
+
+    One scandir of parent replaces a failing mkdir plus a stat for each
+    directory that is already there when the fixtures are regenerated.
+    """
+    try:
+        with os.scandir(parent) as entries:
+            _seen_dirs.update(
+                parent / entry.name for entry in entries
+                if entry.is_dir(follow_symlinks=False)
+            )
+    except FileNotFoundError:
+        return
+    _seen_dirs.add(parent)
+
+
+# Flags for writing a whole small file with one os.write(). Fixtures are
+# disposable, so files are written in place: no temp file and rename, no
+# fsync. O_NOATIME is left out; a write-only open never updates atime, and
+# the flag fails with EPERM on files owned by another user.
+_WRITE_FLAGS = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0)
+
+
+# Files per task when writing a directory's worth of files on the pool.
+_WRITE_BATCH_FILES = 64
+
+# Payloads of at least one filesystem block are preallocated before the
+# write, so the filesystem reserves the extent once instead of growing the
+# file during the write. Not available on Windows or macOS.
+_FALLOCATE_MIN_BYTES = 4096
+_HAS_FALLOCATE = hasattr(os, "posix_fallocate")
+
+
+def _write_small(file_path, payload, dir_fd=None):
+    """Write payload bytes to file_path with a raw open/write/close.
+
+    A file already present with the payload's size is left alone, so a
+    rerun over an existing tree costs one stat per file. Only the size is
+    checked: a same-size edit is not undone. Returns whether the file was
+    written.
+    """
+    try:
+        if os.stat(file_path, dir_fd=dir_fd).st_size == len(payload):
+            return False
+    except FileNotFoundError:
+        pass
+    fd = os.open(file_path, _WRITE_FLAGS, 0o644, dir_fd=dir_fd)
+    try:
+        if _HAS_FALLOCATE and len(payload) >= _FALLOCATE_MIN_BYTES:
+            try:
+                os.posix_fallocate(fd, 0, len(payload))
+            except OSError:
+                pass  # e.g. unsupported by the filesystem; the write still extends the file
+        os.write(fd, payload)
+    finally:
+        os.close(fd)
+    return True
+
+
+def _create_file(file_path, payload):
+    """Write payload to file_path via _write_small and log the outcome."""
+    if _write_small(file_path, payload):
+        log.info("Created file: %s", file_path)
+    else:
+        log.info("Kept existing file: %s", file_path)
+
+
+def _write_batch(directory, files):
+    """Write (name, payload) pairs into directory; return how many were written.
+
+    Where supported, names are opened relative to one open fd of directory,
+    so the kernel resolves a single component per file.
+    """
+    if os.open not in os.supports_dir_fd:
+        return sum(_write_small(os.path.join(directory, name), payload)
+                   for name, payload in files)
+    dir_fd = os.open(directory, os.O_RDONLY | getattr(os, "O_DIRECTORY", 0))
+    try:
+        return sum(_write_small(name, payload, dir_fd=dir_fd) for name, payload in files)
+    finally:
+        os.close(dir_fd)
+
+
 def create_test_structure():
     """Create the complete test directory structure with sample files."""
     base_dir = Path("test")
+    _note_existing_dirs(base_dir)
     
-    # Create base test directory
-    base_dir.mkdir(exist_ok=True)
-    print(f"Created directory: {base_dir}")
-    
-    # Test folder 1
+    # Create base test directory, test folder 1 and its subdir1 in one go
     test_folder1 = base_dir / "test_folder1"
-    test_folder1.mkdir(exist_ok=True)
-    print(f"Created directory: {test_folder1}")
+    subdir1_path = test_folder1 / "subdir1"
+    _mkdir(subdir1_path)
+    log.info("Created directory: %s", base_dir)
+    log.info("Created directory: %s", test_folder1)
     
     # Create files in test_folder1
-    files_folder1 = {
-        "common.txt": "This is a common file in folder 1\nShared content\nLine 3",
-        "file1.txt": "Content of file1 in test_folder1\nUnique to folder 1",
-        "unique1.txt": "This file only exists in test_folder1\nSpecial content for testing",
-    }
-    
-    for filename, content in files_folder1.items():
-        file_path = test_folder1 / filename
-        file_path.write_text(content)
-        print(f"Created file: {file_path}")
-    
-    # Create subdir1 in test_folder1
-    subdir1_path = test_folder1 / "subdir1"
-    subdir1_path.mkdir(exist_ok=True)
-    print(f"Created directory: {subdir1_path}")
+    for filename, content in _FOLDER1_FILES.items():
+        file_path = os.path.join(test_folder1, filename)
+        _create_file(file_path, content)
     
-    subdir1_files = {
-        "sub_file.txt": "Subdirectory file content\nNested file in folder1/subdir1",
-        "sub_file1.txt": "Another subdirectory file\nOnly in folder1",
-    }
+    # Files in subdir1 of test_folder1
+    log.info("Created directory: %s", subdir1_path)
     
-    for filename, content in subdir1_files.items():
-        file_path = subdir1_path / filename
-        file_path.write_text(content)
-        print(f"Created file: {file_path}")
+    for filename, content in _SUBDIR1_FILES.items():
+        file_path = os.path.join(subdir1_path, filename)
+        _create_file(file_path, content)
     
-    # Test folder 2
+    # Test folder 2 and its subdir1
     test_folder2 = base_dir / "test_folder2"
-    test_folder2.mkdir(exist_ok=True)
-    print(f"Created directory: {test_folder2}")
+    subdir2_path = test_folder2 / "subdir1"
+    _mkdir(subdir2_path)
+    log.info("Created directory: %s", test_folder2)
     
     # Create files in test_folder2
-    files_folder2 = {
-        "common.txt": "This is a common file in folder 2\nShared content\nLine 3",  # Same as folder1
-        "file1.txt": "Content of file1 in test_folder2\nDifferent from folder 1",
-        "unique2.txt": "This file only exists in test_folder2\nSpecial content for testing folder 2",
-    }
-    
-    for filename, content in files_folder2.items():
-        file_path = test_folder2 / filename
-        file_path.write_text(content)
-        print(f"Created file: {file_path}")
-    
-    # Create subdir1 in test_folder2
-    subdir2_path = test_folder2 / "subdir1"
-    subdir2_path.mkdir(exist_ok=True)
-    print(f"Created directory: {subdir2_path}")
+    for filename, content in _FOLDER2_FILES.items():
+        file_path = os.path.join(test_folder2, filename)
+        _create_file(file_path, content)
     
-    subdir2_files = {
-        "sub_file.txt": "Subdirectory file content\nNested file in folder2/subdir1",  # Same as folder1
-        "sub_file1.txt": "Another subdirectory file\nOnly in folder2, different content",
-        "sub_file2.txt": "Extra file in folder2 subdir\nUnique to test_folder2/subdir1",
-    }
+    # Files in subdir1 of test_folder2
+    log.info("Created directory: %s", subdir2_path)
     
-    for filename, content in subdir2_files.items():
-        file_path = subdir2_path / filename
-        file_path.write_text(content)
-        print(f"Created file: {file_path}")
+    for filename, content in _SUBDIR2_FILES.items():
+        file_path = os.path.join(subdir2_path, filename)
+        _create_file(file_path, content)
     
     # Create symbolic links for takeout.zip (pointing to a dummy file)
-    dummy_zip_content = b"PK\x03\x04\x14\x00\x00\x00\x08\x00"  # Minimal zip header
     dummy_zip_path = base_dir / "dummy.zip"
-    dummy_zip_path.write_bytes(dummy_zip_content)
+    _write_small(dummy_zip_path, _DUMMY_ZIP)
     
     # Create symbolic links
-    takeout1_link = test_folder1 / "takeout.zip"
-    takeout2_link = test_folder2 / "takeout.zip"
+    for takeout_link in (test_folder1 / "takeout.zip", test_folder2 / "takeout.zip"):
+        try:
+            os.symlink("../dummy.zip", takeout_link)
+            log.info("Created symlink: %s -> ../dummy.zip", takeout_link)
+        except FileExistsError:
+            log.info("Kept existing file: %s", takeout_link)
+        except (OSError, NotImplementedError):
+            # Fallback: copy the file instead of creating symlink
+            _write_small(takeout_link, _DUMMY_ZIP)
+            log.info("Created file (symlink fallback): %s", takeout_link)
     
-    try:
-        takeout1_link.symlink_to("../dummy.zip")
-        print(f"Created symlink: {takeout1_link} -> ../dummy.zip")
-    except (OSError, NotImplementedError):
-        # Fallback: copy the file instead of creating symlink
-        takeout1_link.write_bytes(dummy_zip_content)
-        print(f"Created file (symlink fallback): {takeout1_link}")
+    _flush_log()
+
+
+def _large_folder_files(folder_num):
+    """Return the (name, payload) pairs of test_large_folder<folder_num>, sorted by name."""
+    folder_name = f"test_large_folder{folder_num}"
+    # Only the file number varies per file; the rest is encoded once.
+    template = (
+        f"Content of file %d in {folder_name}\n"
+        "File number: %d\n"
+        f"Folder: {folder_name}\n"
+    ).encode("utf-8")
+    # Add some variation between folders
+    modified = b"Modified content for folder 2\n" if folder_num == 2 else b""
     
-    try:
-        takeout2_link.symlink_to("../dummy.zip")
-        print(f"Created symlink: {takeout2_link} -> ../dummy.zip")
-    except (OSError, NotImplementedError):
-        # Fallback: copy the file instead of creating symlink
-        takeout2_link.write_bytes(dummy_zip_content)
-        print(f"Created file (symlink fallback): {takeout2_link}")
+    files = []
+    for i in _LARGE_FILE_NUMBERS:
+        content = template % (i, i)
+        if i <= 150:
+            content += modified
+        files.append((f"file_{i}.txt", content))
+    
+    files.sort()
+    return files
 
 
 def create_large_test_folders():
     """Create large test folders with many files for performance testing."""
     base_dir = Path("test")
     
+    # Plan every file of both folders first, then write them on a thread
+    # pool; each write is a few tiny syscalls that release the GIL. Files are
+    # grouped into name-ordered batches per directory, so each task stays
+    # within one directory.
+    folder_names = []
+    batches = []
+    
     # Create test_large_folder1 and test_large_folder2
     for folder_num in [1, 2]:
         folder_name = f"test_large_folder{folder_num}"
         large_folder = base_dir / folder_name
-        large_folder.mkdir(exist_ok=True)
-        print(f"Created directory: {large_folder}")
-        
-        # Create numbered files
-        file_numbers = list(range(1, 251))  # 250 files
-        
-        # Add some files with different numbering patterns for testing sorting
-        additional_numbers = [10, 100, 1000, 10000] + list(range(1001, 1100))
-        file_numbers.extend(additional_numbers)
+        _mkdir(large_folder)
+        log.info("Created directory: %s", large_folder)
+        folder_names.append(folder_name)
         
-        for i in file_numbers:
-            filename = f"file_{i}.txt"
-            content = f"Content of file {i} in {folder_name}\n"
-            content += f"File number: {i}\n"
-            content += f"Folder: {folder_name}\n"
-            
-            # Add some variation between folders
-            if folder_num == 2 and i <= 150:
-                content += "Modified content for folder 2\n"
-            
-            file_path = large_folder / filename
-            file_path.write_text(content)
-            
-            # Print progress every 50 files
-            if i % 50 == 0:
-                print(f"Created {i} files in {folder_name}")
-        
-        print(f"Completed {folder_name} with {len(file_numbers)} files")
+        files = _large_folder_files(folder_num)
+        for start in range(0, len(files), _WRITE_BATCH_FILES):
+            batches.append((large_folder, files[start:start + _WRITE_BATCH_FILES]))
+    
+    written = dict.fromkeys(folder_names, 0)
+    with ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4)) as executor:
+        # Consuming the results re-raises the first failed write, if any.
+        for (directory, _), count in zip(batches, executor.map(_write_batch, *zip(*batches))):
+            written[directory.name] += count
+    
+    for folder_name in folder_names:
+        kept = len(_LARGE_FILE_NUMBERS) - written[folder_name]
+        if kept:
+            log.info("Completed %s with %d files (%d existing files kept)",
+                     folder_name, len(_LARGE_FILE_NUMBERS), kept)
+        else:
+            log.info("Completed %s with %d files", folder_name, len(_LARGE_FILE_NUMBERS))
+    _flush_log()
 
 
 def create_mixed_content_files():
@@ -152,78 +321,141 @@ def create_mixed_content_files():
     
     # Create a mixed content folder
     mixed_folder = base_dir / "mixed_content"
-    mixed_folder.mkdir(exist_ok=True)
-    print(f"Created directory: {mixed_folder}")
-    
-    # Various file types and contents
-    mixed_files = {
-        "empty_file.txt": "",
-        "single_line.txt": "Single line file",
-        "multi_line.txt": "Line 1\nLine 2\nLine 3\nLine 4",
-        "unicode_content.txt": "Unicode: αβγδε ñáéíóú 中文 🚀",
-        "numbers.txt": "\n".join(str(i) for i in range(1, 101)),
-        "whitespace.txt": "   \n\t\n   spaces and tabs   \n",
-        "long_line.txt": "A" * 1000,
-    }
-    
-    for filename, content in mixed_files.items():
-        file_path = mixed_folder / filename
-        file_path.write_text(content, encoding='utf-8')
-        print(f"Created file: {file_path}")
+    _mkdir(mixed_folder)
+    log.info("Created directory: %s", mixed_folder)
+    
+    for filename, content in _MIXED_FILES.items():
+        file_path = os.path.join(mixed_folder, filename)
+        _create_file(file_path, content)
+    
+    _flush_log()
+
+
+def create_test_archive(dest="test_fixtures.tar"):
+    """Write the whole test tree into one tar archive instead of many files.
+
+    Members are stored under test/, so extracting the archive (e.g. with
+    tarfile.open(dest).extractall()) gives the same tree as the creators
+    above.
+    """
+    mtime = time.time()
+
+    with tarfile.open(dest, "w", bufsize=1 << 20) as tar:
+        def add(name, kind, mode, content=b"", linkname=""):
+            info = tarfile.TarInfo(name)
+            info.type = kind
+            info.mode = mode
+            info.mtime = mtime
+            info.size = len(content)
+            info.linkname = linkname
+            tar.addfile(info, io.BytesIO(content) if content else None)
+
+        def add_dir(directory, files=()):
+            add(directory, tarfile.DIRTYPE, 0o755)
+            for filename, content in files:
+                add(f"{directory}/{filename}", tarfile.REGTYPE, 0o644, content)
+
+        add_dir("test", [("dummy.zip", _DUMMY_ZIP)])
+        add_dir("test/test_folder1", _FOLDER1_FILES.items())
+        add_dir("test/test_folder1/subdir1", _SUBDIR1_FILES.items())
+        add_dir("test/test_folder2", _FOLDER2_FILES.items())
+        add_dir("test/test_folder2/subdir1", _SUBDIR2_FILES.items())
+        for folder in ("test/test_folder1", "test/test_folder2"):
+            add(f"{folder}/takeout.zip", tarfile.SYMTYPE, 0o777, linkname="../dummy.zip")
+        for folder_num in [1, 2]:
+            add_dir(f"test/test_large_folder{folder_num}", _large_folder_files(folder_num))
+        add_dir("test/mixed_content", _MIXED_FILES.items())
+
+    log.info("Created test archive: %s", dest)
+    log.info("Extract it with: tar -xf %s", dest)
+
+
+# Printed once the tree has been created.
+_SUMMARY = """
+Test directory structure:
+test/
+├── test_folder1/
+│   ├── common.txt
+│   ├── file1.txt
+│   ├── unique1.txt
+│   ├── takeout.zip -> ../dummy.zip
+│   └── subdir1/
+│       ├── sub_file.txt
+│       └── sub_file1.txt
+├── test_folder2/
+│   ├── common.txt
+│   ├── file1.txt
+│   ├── unique2.txt
+│   ├── takeout.zip -> ../dummy.zip
+│   └── subdir1/
+│       ├── sub_file.txt
+│       ├── sub_file1.txt
+│       └── sub_file2.txt
+├── test_large_folder1/ (250+ files)
+├── test_large_folder2/ (250+ files)
+├── mixed_content/
+└── dummy.zip
+
+You can now test chksync with:
+python chksync.py test/test_folder1 test/test_folder2
+python chksync.py test/test_large_folder1 test/test_large_folder2"""
 
 
 def main():
     """Main function to create all test files and directories."""
-    print("Creating test file structure for chksync...")
-    print("=" * 50)
+    parser = argparse.ArgumentParser(description="Create test files and directories for chksync.")
+    parser.add_argument(
+        "--archive", nargs="?", const="test_fixtures.tar", metavar="DEST",
+        help="write the test tree into a single tar archive (default: %(const)s) "
+             "instead of creating the files",
+    )
+    parser.add_argument(
+        "-q", "--quiet", action="store_true",
+        help="only report errors, not every directory and file created",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(
+        level=logging.WARNING if args.quiet else logging.INFO,
+        format="%(message)s",
+        handlers=[_stdout_handler],
+    )
+    
+    if args.archive:
+        try:
+            create_test_archive(args.archive)
+        except (OSError, tarfile.TarError) as e:
+            log.error("❌ Error creating test archive: %s", e)
+            return 1
+        finally:
+            _flush_log()
+        return 0
+    
+    log.info("Creating test file structure for chksync...")
+    log.info("=" * 50)
     
     try:
         # Create basic test structure
         create_test_structure()
-        print("\n" + "=" * 50)
+        log.info("\n" + "=" * 50)
         
         # Create large test folders
-        print("Creating large test folders...")
+        log.info("Creating large test folders...")
         create_large_test_folders()
-        print("\n" + "=" * 50)
+        log.info("\n" + "=" * 50)
         
         # Create mixed content files
-        print("Creating mixed content files...")
+        log.info("Creating mixed content files...")
         create_mixed_content_files()
-        print("\n" + "=" * 50)
-        
-        print("✅ Test file structure created successfully!")
-        print("\nTest directory structure:")
-        print("test/")
-        print("├── test_folder1/")
-        print("│   ├── common.txt")
-        print("│   ├── file1.txt")
-        print("│   ├── unique1.txt")
-        print("│   ├── takeout.zip -> ../dummy.zip")
-        print("│   └── subdir1/")
-        print("│       ├── sub_file.txt")
-        print("│       └── sub_file1.txt")
-        print("├── test_folder2/")
-        print("│   ├── common.txt")
-        print("│   ├── file1.txt")
-        print("│   ├── unique2.txt")
-        print("│   ├── takeout.zip -> ../dummy.zip")
-        print("│   └── subdir1/")
-        print("│       ├── sub_file.txt")
-        print("│       ├── sub_file1.txt")
-        print("│       └── sub_file2.txt")
-        print("├── test_large_folder1/ (250+ files)")
-        print("├── test_large_folder2/ (250+ files)")
-        print("├── mixed_content/")
-        print("└── dummy.zip")
+        log.info("\n" + "=" * 50)
         
-        print(f"\nYou can now test chksync with:")
-        print("python chksync.py test/test_folder1 test/test_folder2")
-        print("python chksync.py test/test_large_folder1 test/test_large_folder2")
+        log.info("✅ Test file structure created successfully!")
+        log.info(_SUMMARY)
         
     except Exception as e:
-        print(f"❌ Error creating test files: {e}")
+        log.error("❌ Error creating test files: %s", e)
         return 1
+    finally:
+        _flush_log()
     
     return 0
 